@@ -20,6 +20,8 @@ from cloudone.api.inventory.plugin import collector_pb2, collector_pb2_grpc
 from cloudone.core.pygrpc import BaseAPI
 from cloudone.core.pygrpc.message_type import *
 
+from cloudone.inventory.lib.metrics import start_metrics_server
+
 _LOGGER = logging.getLogger(__name__)
 
 class Collector(BaseAPI, collector_pb2_grpc.CollectorServicer):
@@ -27,6 +29,11 @@ class Collector(BaseAPI, collector_pb2_grpc.CollectorServicer):
     pb2 = collector_pb2
     pb2_grpc = collector_pb2_grpc
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # /metrics next to gRPC API
+        start_metrics_server()
+
     def verify(self, request, context):
         params, metadata = self.parse_request(request, context)
 
@@ -10,3 +10,35 @@ HANDLERS = {
 
 ENDPOINTS = {
 }
+
+# Worker threads shared by all collect requests of this process
+MAX_WORKERS = 32
+
+# Hedged regional calls (options.hedge)
+# duplicate is sent after this latency percentile of (operation, region)
+HEDGE_PERCENTILE = 0.95
+# at most this ratio of calls are hedged
+HEDGE_BUDGET_RATIO = 0.05
+# threads (and connections) sending hedged calls, shared by all collections
+HEDGE_WORKERS = 48
+
+# Latency history of (account, region, service), longest task starts first
+# None keeps history in memory only
+LATENCY_HISTORY_PATH = '/tmp/aws-summary/latency_history.json'
+
+# Parse processes of options.process_parsing, None is CPU count
+PARSE_WORKERS = None
+
+# Background refresh of options.stale_while_revalidate
+REFRESH_INTERVAL = 600
+REFRESH_JITTER = 0.1
+REFRESH_CONCURRENCY = 2
+# Account which is not requested for this seconds is not refreshed any more
+REFRESH_EXPIRE = 86400
+
+# Prometheus metrics at http://0.0.0.0:METRICS_PORT/metrics (no authentication),
+# None disables it, set a port like 9090 to enable
+METRICS_PORT = None
+
+# Threads listing key ranges of big S3 buckets, shared by all collections
+S3_LIST_WORKERS = 16
@@ -28,18 +28,35 @@ import urllib.request
 import time
 import threading
 import pprint
+import queue
+import types
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from cloudone.core.transaction import Transaction
 from cloudone.core.error import *
 from cloudone.core.connector import BaseConnector
 
+from cloudone.inventory.lib.aggregator import aggregate
+from cloudone.inventory.lib.change_detector import get_change_detector, requester_hash, summary_hash
+from cloudone.inventory.lib.hedge import get_hedger
+from cloudone.inventory.lib.latency_history import get_latency_history
+from cloudone.inventory.lib.metrics import instrument_session, COLLECTIONS, COLLECTION_DURATION, \
+    S3_BYTES_SCANNED, S3_OBJECTS_SCANNED
+from cloudone.inventory.lib.s3_usage import bucket_usage
+from cloudone.inventory.lib.raw_parser import aggregate_in_process, parse_ec2_instances, \
+    parse_rds_clusters, parse_rds_instances
+from cloudone.inventory.lib.profiler import phase
+from cloudone.inventory.lib.scheduler import get_scheduler
+
 _LOGGER = logging.getLogger(__name__)
 
 
 RESOURCES = ['cloudformation', 'cloudwatch', 'dynamodb', 'ec2', 'glacier', 'iam', 'opsworks', 's3', 'sns', 'sqs']
 
+# Buckets per page of paginated ListBuckets
+LIST_BUCKETS_PAGE_SIZE = 1000
+
 ################################################
 # Define local method here
 # since REGION_SERVICES use method as value
@@ -50,24 +67,18 @@ def _find_ec2(service_name, client, resource):
     Returns: dict
         {
             'total_count': N,
-            'instances': {EC2_TYPE: Num of instances}
+            'type': {EC2_TYPE: Num of instances},
+            'state': {STATE: Num of instances},
+            'availability_zone': {AZ: Num of instances}
         }
     """
-    resp = client.describe_instances()
-    instance_groups = resp['Reservations']
+    agg = aggregate(client, 'describe_instances',
+                    'Reservations[].Instances[].[InstanceType, State.Name, Placement.AvailabilityZone]',
+                    ['type', 'state', 'availability_zone'])
     result = {}
-    count = 0
-    ec2_per_type = {}
-    for instances in instance_groups:
-        for instance in instances['Instances']:
-            ec2_type = instance['InstanceType']
-            ec2_type = ec2_type.replace('.','-')               # We cannot use . as key
-            i_type = ec2_per_type.get(ec2_type, 0)
-            i_type += 1
-            ec2_per_type[ec2_type] = i_type
-            count += 1
-    result['total_count'] = count
-    result['type'] = ec2_per_type
+    result['total_count'] = agg.rows
+    if agg.rows > 0:
+        result.update(agg.summary())
     return {service_name: result}
  
 def _find_elb(service_name, client, resource):
@@ -75,37 +86,32 @@ def _find_elb(service_name, client, resource):
 
     Returns: dict
         {
-            'total_count': N,
-            'elb': {ELB_TYPE: Num of elbs}
+            'total_count': N
         }
     """
-    resp = client.describe_load_balancers()
-    elb_groups = resp['LoadBalancerDescriptions']
+    agg = aggregate(client, 'describe_load_balancers',
+                    'LoadBalancerDescriptions', [])
     result = {}
-    count = 0
-    for elbs in elb_groups:
-        elb_type = 'clb'
-        count += 1
-    result['total_count'] = count
+    result['total_count'] = agg.rows
     return {service_name: result}
 
 def _find_elbv2(service_name, client, resource):
     """ Find all ALB, NLB
+
+    Returns: dict
+        {
+            'total_count': N,
+            'type': {ELB_TYPE: Num of elbs},
+            'scheme': {SCHEME: Num of elbs}
+        }
     """
-    resp = client.describe_load_balancers()
-    elb_groups = resp['LoadBalancers']
+    agg = aggregate(client, 'describe_load_balancers',
+                    'LoadBalancers[].[Type, Scheme]',
+                    ['type', 'scheme'])
     result = {}
-    count = 0
-    elb_per_type = {}
-    for elb in elb_groups:
-        elb_type = elb['Type']
-        instances = elb_per_type.get(elb_type, 0)
-        instances += 1
-        elb_per_type[elb_type] = instances
-        count += 1
-    result['total_count'] = count
-    if count > 0:
-        result['type'] = elb_per_type
+    result['total_count'] = agg.rows
+    if agg.rows > 0:
+        result.update(agg.summary())
     return {service_name: result}
 
 def _find_dynamodb(service_name, client, resource):
@@ -113,17 +119,12 @@ def _find_dynamodb(service_name, client, resource):
 
     Returns: dict
         {
-            'total_count': N,
-            'elb': {ELB_TYPE: Num of elbs}
+            'total_count': N
         }
     """
-    resp = client.list_tables()
-    resource_groups = resp['TableNames']
+    agg = aggregate(client, 'list_tables', 'TableNames', [])
     result = {}
-    count = 0
-    for resource in resource_groups:
-        count += 1
-    result['total_count'] = count
+    result['total_count'] = agg.rows
     return {service_name: result}
 
 def _find_lambda(service_name, client, resource):
@@ -135,39 +136,30 @@ def _find_lambda(service_name, client, resource):
             'runtime': {RUNTIME: Num of runtime}
         }
     """
-    resp = client.list_functions()
-    resource_groups = resp['Functions']
+    agg = aggregate(client, 'list_functions', 'Functions[].[Runtime]', ['runtime'])
     result = {}
-    count = 0
-    for resource in resource_groups:
-        count += 1
-    result['total_count'] = count
+    result['total_count'] = agg.rows
+    if agg.rows > 0:
+        result.update(agg.summary())
     return {service_name: result}
 
 def _find_rds(service_name, client, resource):
     """ Find all RDS
 
+    Total count is number of DB clusters and DB instances
+
     Returns: dict
         {
             'total_count': N,
-            'runtime': {RUNTIME: Num of runtime}
+            'engine': {ENGINE: Num of DB instances}
         }
     """
-    resp = client.describe_db_clusters()
-    resource_groups = resp['DBClusters']
+    clusters = aggregate(client, 'describe_db_clusters', 'DBClusters[].[Engine]', ['engine'])
+    instances = aggregate(client, 'describe_db_instances', 'DBInstances[].[Engine]', ['engine'])
     result = {}
-    count = 0
-    aurora_count = 0
-    for resource in resource_groups:
-        count += 1
-        aurora_count += 1
-
-    resp = client.describe_db_instances()
-    resource_groups = resp['DBInstances']
-    for resource in resource_groups:
-        count += 1
-        print(resource['Engine'])
-    result['total_count'] = count
+    result['total_count'] = clusters.rows + instances.rows
+    if instances.rows > 0:
+        result.update(instances.summary())
     return {service_name: result}
 
 
@@ -177,81 +169,258 @@ def _find_route53(service_name, client, resource):
 
     Returns: dict
         {
-            'total_count': N,
-            'runtime': {RUNTIME: Num of runtime}
+            'total_count': N
         }
     """
-    resp = client.list_hosted_zones()
-    resource_groups = resp['HostedZones']
+    agg = aggregate(client, 'list_hosted_zones', 'HostedZones', [])
     result = {}
-    count = 0
-    for resource in resource_groups:
-        count += 1
-    result['total_count'] = count
+    result['total_count'] = agg.rows
     return {'global': {service_name: result}}
 
 
 def _find_s3(service_name, client, resource):
     """ Find all S3 buckets
 
-    Returns: dict
+    Bucket is added to counters of its region and dropped,
+    so memory does not grow with number of buckets.
+    Buckets are listed twice: first to count buckets per region, then to
+    scan them. Region is yielded as soon as its last bucket is scanned,
+    with regions which are not scanned yet, so collect_info can emit
+    the other regions before S3 is done.
+
+    Yields: (dict, set of pending regions)
         {REGION_NAME: 's3': {
                         {
                         'total_count': N,
-                        'buckets': {BUCKET_NAME: Num of instances}
+                        'type': {'total_size(GB)': SIZE, 'total_objects': N}
                         }
                 }
         }
     """
-    s3 = resource
-
-    def _get_location(bucket_name):
-        response = client.get_bucket_location(Bucket=bucket_name)
+    def _get_location(bucket):
+        response = client.get_bucket_location(Bucket=bucket['Name'])
         loc = response['LocationConstraint']
         if loc == None:
             return 'us-east-1'
         return loc
 
     def _get_bucket_info(bucket_name):
-        
-        bucket = s3.Bucket(bucket_name)
-        total_size = 0
-        obj_count = 0
-        for object in bucket.objects.all():
-            obj_count += 1
-            total_size += object.size
+        # Big bucket is listed by key range partitions in parallel
+        obj_count, total_size = bucket_usage(client, bucket_name)
+        S3_OBJECTS_SCANNED.inc(obj_count)
+        S3_BYTES_SCANNED.inc(total_size)
+
+        return obj_count, total_size
+
+    def _add(counter, bucket):
+        obj_count, bucket_size = _get_bucket_info(bucket['Name'])
+        counter[0] += 1
+        counter[1] += obj_count
+        counter[2] += bucket_size
+
+    def _rollup(region_name, counter):
+        bucket_count, obj_count, total_size = counter
+        s3_resource = {region_name: {'s3': {
+            'total_count': bucket_count,
+            'type': {'total_size(GB)': total_size/1024/1024/1024, 'total_objects': obj_count}
+        }}}
+        _LOGGER.debug(f'[_find_s3] {s3_resource}')
+        return s3_resource
+
+    def _get_region(bucket):
+        return bucket.get('BucketRegion') or _get_location(bucket)
+
+    if client.can_paginate('list_buckets'):
+        paginator = client.get_paginator('list_buckets')
+
+        def _list_buckets():
+            # BucketRegion is returned only if request has a parameter
+            for page in paginator.paginate(MaxBuckets=LIST_BUCKETS_PAGE_SIZE):
+                yield from page.get('Buckets', [])
+
+        # {REGION_NAME: Num of buckets not scanned yet}
+        remaining = {}
+        for bucket in _list_buckets():
+            region_name = _get_region(bucket)
+            remaining[region_name] = remaining.get(region_name, 0) + 1
+        # Regions without bucket are final
+        yield {}, set(remaining)
+
+        # {REGION_NAME: [Num of buckets, Num of objects, Size in bytes]}
+        counters = {}
+        for bucket in _list_buckets():
+            region_name = _get_region(bucket)
+            if region_name not in remaining:
+                # Created after the first listing
+                continue
+            _add(counters.setdefault(region_name, [0, 0, 0]), bucket)
+            remaining[region_name] -= 1
+            if remaining[region_name] == 0:
+                del remaining[region_name]
+                yield _rollup(region_name, counters.pop(region_name)), set(remaining)
+
+        # Buckets deleted after the first listing
+        for region_name, counter in counters.items():
+            yield _rollup(region_name, counter), set()
+        return
+
+    # Region of bucket is known only by GetBucketLocation
+    counters = {}
+    for bucket in client.list_buckets()['Buckets']:
+        _add(counters.setdefault(_get_location(bucket), [0, 0, 0]), bucket)
+    pending = set(counters)
+    for region_name, counter in counters.items():
+        pending.discard(region_name)
+        yield _rollup(region_name, counter), set(pending)
 
-        return obj_count, total_size/1024/1024/1024
+################################################
+# Parse in process
+# Response is parsed and counted in parse process,
+# only network I/O is done in collector thread
+################################################
+def _find_ec2_in_process(service_name, client, resource):
+    """ Find all EC2 instances, same result as _find_ec2
+    """
+    agg = aggregate_in_process(client, 'describe_instances', 'DescribeInstances', 'NextToken',
+                               parse_ec2_instances, MaxResults=1000)
+    result = {}
+    result['total_count'] = agg['rows']
+    if agg['rows'] > 0:
+        result.update(agg['counts'])
+    return {service_name: result}
 
-    resp = client.list_buckets()
-    buckets = resp['Buckets']
+def _find_rds_in_process(service_name, client, resource):
+    """ Find all RDS, same result as _find_rds
+    """
+    clusters = aggregate_in_process(client, 'describe_db_clusters', 'DescribeDBClusters', 'Marker',
+                                    parse_rds_clusters)
+    instances = aggregate_in_process(client, 'describe_db_instances', 'DescribeDBInstances', 'Marker',
+                                     parse_rds_instances)
     result = {}
-    for bucket in buckets:
-        bucket_name = bucket['Name']
-        location = _get_location(bucket_name)
-        per_region = result.get(location, {})
+    result['total_count'] = clusters['rows'] + instances['rows']
+    if instances['rows'] > 0:
+        result.update(instances['counts'])
+    return {service_name: result}
 
-        count_per_region = per_region.get('total_count', 0)
-        type_per_region = per_region.get('type', {})
+################################################
+# Count only
+# Aggregate or minimal-payload APIs, used when
+# detailed breakdown is not requested
+################################################
+def _count_ec2(service_name, client, resource):
+    """ Count EC2 instances from instance status (no instance description)
 
-        total_size = type_per_region.get('total_size', 0)
-        total_obj  = type_per_region.get('total_objects', 0)
+    Returns: dict
+        {
+            'total_count': N
+        }
+    """
+    agg = aggregate(client, 'describe_instance_status', 'InstanceStatuses', [],
+                    IncludeAllInstances=True)
+    result = {}
+    result['total_count'] = agg.rows
+    return {service_name: result}
 
-        obj_count, bucket_size = _get_bucket_info(bucket_name)
-        count_per_region += 1
-        total_size += bucket_size
-        total_obj  += obj_count
+def _count_lambda(service_name, client, resource):
+    """ Count Lambda functions from account settings
 
-        per_region['type'] = {'total_size(GB)': total_size, 'total_objects': total_obj} 
-        per_region['total_count'] = count_per_region
-        result.update({location: per_region})
+    Returns: dict
+        {
+            'total_count': N
+        }
+    """
+    resp = client.get_account_settings()
+    result = {}
+    result['total_count'] = resp['AccountUsage']['FunctionCount']
+    return {service_name: result}
 
-    
-    s3_resource = {}
-    for region_name, buckets in result.items():
-        s3_resource[region_name] = {'s3': buckets}
-    pprint.pprint(s3_resource)
-    return s3_resource
+def _count_rds(service_name, client, resource):
+    """ Count RDS from account quota usage (DB clusters and DB instances)
+
+    Returns: dict
+        {
+            'total_count': N
+        }
+    """
+    resp = client.describe_account_attributes()
+    used = {}
+    for quota in resp['AccountQuotas']:
+        used[quota['AccountQuotaName']] = quota['Used']
+    result = {}
+    result['total_count'] = used.get('DBClusters', 0) + used.get('DBInstances', 0)
+    return {service_name: result}
+
+def _count_route53(service_name, client, resource):
+    """ Count Route53 hosted zones
+
+    Returns: dict
+        {
+            'total_count': N
+        }
+    """
+    resp = client.get_hosted_zone_count()
+    result = {}
+    result['total_count'] = resp['HostedZoneCount']
+    return {'global': {service_name: result}}
+
+def _count_s3(service_name, client, resource):
+    """ Count S3 buckets per region, without listing objects
+
+    Returns: dict
+        {REGION_NAME: 's3': {
+                        'total_count': N
+                        }
+        }
+    """
+    resp = client.list_buckets()
+    result = {}
+    for bucket in resp['Buckets']:
+        location = bucket.get('BucketRegion')
+        if location is None:
+            location = client.get_bucket_location(Bucket=bucket['Name'])['LocationConstraint'] or 'us-east-1'
+        per_region = result.setdefault(location, {'s3': {'total_count': 0}})
+        per_region['s3']['total_count'] += 1
+    return result
+
+def _count_usage(service_name, client, resource):
+    """ Count services of USAGE_METRICS with one batched CloudWatch GetMetricData
+
+    Services without published usage metric are not in result,
+    caller has to find them with REGION_SERVICES.
+
+    Returns: dict
+        {
+            SERVICE: {'total_count': N},
+            ...
+        }
+    """
+    now = datetime.utcnow()
+    queries = []
+    services = {}
+    for idx, (service, dimensions) in enumerate(USAGE_METRICS.items()):
+        query_id = f'usage{idx}'
+        services[query_id] = service
+        queries.append({
+            'Id': query_id,
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': 'AWS/Usage',
+                    'MetricName': 'ResourceCount',
+                    'Dimensions': [{'Name': k, 'Value': v} for k, v in dimensions.items()]
+                },
+                'Period': 300,
+                'Stat': 'Maximum'
+            }
+        })
+    resp = client.get_metric_data(MetricDataQueries=queries,
+                                  StartTime=now - timedelta(hours=1),
+                                  EndTime=now,
+                                  ScanBy='TimestampDescending')
+    result = {}
+    for metric in resp['MetricDataResults']:
+        if metric['Values']:
+            result[services[metric['Id']]] = {'total_count': int(metric['Values'][0])}
+    return result
 
 # Find per region
 REGION_SERVICES = {
@@ -268,6 +437,12 @@ REGION_SERVICES = {
 #    'elb'       : _find_elb,
 #}
 
+# Parse in process, replaces REGION_SERVICES
+IN_PROCESS_SERVICES = {
+    'ec2'       : _find_ec2_in_process,
+    'rds'       : _find_rds_in_process,
+}
+
 # Find at One time
 GLOBAL_SERVICES = {
     's3' : _find_s3,
@@ -278,16 +453,53 @@ GLOBAL_SERVICES = {
 #    'route53'   : _find_route53,
 #}
 
+# Count only, per region
+# services in USAGE_METRICS are counted by _count_usage
+REGION_COUNTERS = {
+    'ec2'       : _count_ec2,
+    'elb'       : _find_elb,
+    'elbv2'     : _find_elbv2,
+    'lambda'    : _count_lambda,
+    'rds'       : _count_rds,
+}
+
+# Count only, at One time
+GLOBAL_COUNTERS = {
+    's3'        : _count_s3,
+    'route53'   : _count_route53,
+}
+
+# AWS/Usage ResourceCount dimensions per service
+USAGE_METRICS = {
+    'dynamodb'  : {'Service': 'DynamoDB', 'Type': 'Resource', 'Resource': 'TableCount', 'Class': 'None'},
+}
+
 class SummaryConnector(BaseConnector):
     def __init__(self, transaction, config):
         super().__init__(transaction, config)
         self.lock = threading.Lock()
         self.result = {}
+        self.options = {}
+        # Timeline of phases, set by profiling mode
+        self.timeline = None
+        # Cassette of AWS responses, set by record/replay mode
+        self.cassette = None
+        self.account_id = None
 
     def verify(self, options, credentials):
+        """
+        options(dict)
+            - count_only: use aggregate APIs, no detailed breakdown (default: False)
+            - change_detection: emit only regions changed since last collection (default: False)
+            - hedge: send duplicate of slow regional call, first response is used (default: False)
+            - process_parsing: parse EC2, RDS responses in parse processes (default: False)
+        """
+        self.options = options
         self.cred = credentials
         # This is connection check for AWS
-        self._set_connect(credentials)
+        with phase(self.timeline, 'session setup'), \
+                COLLECTION_DURATION.time(phase='session setup'):
+            self._set_connect(credentials)
         return "ACTIVE"
         #return self.conf
 
@@ -296,10 +508,15 @@ class SummaryConnector(BaseConnector):
         cred(dict)
             - aws_access_key_id
             - aws_secret_access_key
+            - aws_session_token (optional, temporary credentials like assumed role)
             - ...
         """
         self.session = boto3.Session(aws_access_key_id=cred['aws_access_key_id'],
-                                    aws_secret_access_key=cred['aws_secret_access_key'])
+                                    aws_secret_access_key=cred['aws_secret_access_key'],
+                                    aws_session_token=cred.get('aws_session_token'))
+        instrument_session(self.session)
+        if self.cassette is not None:
+            self.cassette.install(self.session)
 
         #proxy = self.conf.get('external_proxy', None)
 
@@ -327,6 +544,16 @@ class SummaryConnector(BaseConnector):
         #    raise ERROR_DRIVER(message='aws connection failed. Please check your authencation information.')
 	
     def collect_info(self, query, region_id=None, zone_id=None, pool_id=None, project_id=None):
+        start = time.perf_counter()
+        try:
+            yield from self._collect_info(query, region_id, zone_id, pool_id, project_id)
+        except Exception:
+            COLLECTIONS.inc(state='FAILURE')
+            raise
+        COLLECTIONS.inc(state='SUCCESS')
+        COLLECTION_DURATION.observe(time.perf_counter() - start, account_id=self.account_id, phase='total')
+
+    def _collect_info(self, query, region_id=None, zone_id=None, pool_id=None, project_id=None):
         def merge_dict(dict1, dict2):
             for region_name2, service2 in dict2.items():
                 print("Merge at : ", region_name2)
@@ -345,62 +572,180 @@ class SummaryConnector(BaseConnector):
 
         client = self.session.client("sts")
         account_id = client.get_caller_identity()["Account"]
-        print(f'ACCOUNT ID: {account_id}')
+        _LOGGER.debug(f'[collect_info] ACCOUNT ID: {account_id}')
+        self.account_id = account_id
 
         # 0. Return CLOUD_SERVICE_TYPE
         yield _prepare_cloud_service_type()
 
-        resource = _prepare_resource_schema()
-        
+        # Full describe only if detailed breakdown is requested
+        count_only = self.options.get('count_only', False)
+        if count_only:
+            global_services = GLOBAL_COUNTERS
+            region_services = REGION_COUNTERS
+        else:
+            global_services = GLOBAL_SERVICES
+            region_services = REGION_SERVICES
+            if self.options.get('process_parsing', False):
+                region_services = dict(REGION_SERVICES, **IN_PROCESS_SERVICES)
+
+        # All tasks of this collection share process-wide workers
+        lane = get_scheduler().open_lane(account_id)
+
         # Global Services
-        result = {}
-        for service, func in GLOBAL_SERVICES.items():
-            params = {
-                'service': service,
-                'region': None,
-                'session': self.session,
-                'func': func,
-                'result': self.result,
-                'lock': self.lock
-            }
-            find_service(params)
+        tasks = []
+        for service, func in global_services.items():
+            tasks.append(self._make_params(service, None, func))
 
         # Regional Services
-        region_list = self._find_all_regions(self.cred)
-        threads = []
+        with phase(self.timeline, 'region discovery'), \
+                COLLECTION_DURATION.time(account_id=account_id, phase='region discovery'):
+            region_list = self._find_all_regions(self.cred)
         for region in region_list:
-            print(f'Discover at {region}....')
-            region_data = result.get(region, {})
+            _LOGGER.debug(f'[collect_info] Discover at {region}....')
+            services = list(region_services.items())
+            if count_only:
+                # One batched GetMetricData per region
+                services.append(('cloudwatch', _count_usage))
             # Loop region
-            for service, func in REGION_SERVICES.items():
-                # Find service by func using thread
-                params = {
-                    'service': service,
-                    'region': region,
-                    'session': self.session,
-                    'func': func,
-                    'result': self.result,
-                    'lock': self.lock
-                }
-                t = threading.Thread(target=find_service, args=(params,))
-                threads.append(t)
-                t.start()
-
-        for t in threads:
-            t.join()
-
-        # Clean-up garbage
-        for region, summary in self.result.items():
+            for service, func in services:
+                tasks.append(self._make_params(service, region, func))
+
+        # Longest expected task starts first
+        history = get_latency_history()
+        tasks = history.longest_first(account_id, tasks)
+
+        # Skip regions which are same as last emitted
+        change_detection = self.options.get('change_detection', False)
+        detector = get_change_detector()
+        requester = requester_hash(self.options, self.cred)
+
+        # Region is emitted and dropped as soon as it is complete
+        for region in self._complete_regions(lane, tasks, region_list, count_only):
+            with self.lock:
+                summary = self.result.pop(region, {})
             if is_empty(summary):
                 continue
-            print(region, summary)
-            resource['data'] = summary
-            resource['data'].update({'region_name': region, 'account_id': account_id})
-            response = _prepare_response_schema()
-            response['resource'].update(resource)
+            if change_detection:
+                digest = summary_hash(summary)
+                if not detector.is_changed(requester, account_id, region, digest):
+                    _LOGGER.debug(f'[collect_info] {region} is not changed')
+                    continue
+            _LOGGER.debug(f'[collect_info] {region} {summary}')
+            with phase(self.timeline, 'response building'), \
+                    COLLECTION_DURATION.time(account_id=account_id, phase='response building'):
+                resource = _prepare_resource_schema()
+                resource['data'] = summary
+                resource['data'].update({'region_name': region, 'account_id': account_id})
+                response = _prepare_response_schema()
+                response['resource'].update(resource)
             yield response
+            if change_detection:
+                detector.update(requester, account_id, region, digest)
 
+        history.save()
 
+    def _complete_regions(self, lane, tasks, region_list, count_only):
+        """ Run find_service of tasks at lane, yield region when its summary is complete
+
+        Global tasks update any region, so a region is complete after its own
+        tasks, and after every global task is done or has reported that it
+        does not update the region any more (like _find_s3, region by region).
+        Regions which are not in region_list (like 'global') are yielded
+        when global tasks are done.
+        In count_only mode, services of USAGE_METRICS without usage metric
+        are found by REGION_SERVICES before region is complete.
+
+        Summary without a failed service would replace stored data of the
+        service, so a region with failed task is not yielded, and failure
+        of global task (which updates any region) fails the collection.
+        """
+        events = queue.Queue()
+        remaining = {region: 0 for region in region_list}
+        # {GLOBAL_SERVICE: regions it may still update, None is any region}
+        running = {}
+        outstanding = 0
+
+        def submit(params):
+            nonlocal outstanding
+            if params['region'] is None:
+                running[params['service']] = None
+            else:
+                remaining[params['region']] += 1
+            outstanding += 1
+            params['pending'] = lambda service, regions: events.put(('pending', params, regions))
+            future = lane.submit(find_service, params)
+            future.add_done_callback(lambda f: events.put(('done', params, f)))
+
+        for params in tasks:
+            submit(params)
+
+        fallback = set()
+        failed = set()
+        while outstanding:
+            kind, params, value = events.get()
+            if kind == 'pending':
+                running[params['service']] = value
+            else:
+                outstanding -= 1
+                error = value.exception()
+                if error is not None:
+                    _LOGGER.error(f"[_complete_regions] {params['region'] or 'global'}/{params['service']} failed: {error}")
+                    if params['region'] is None:
+                        raise error
+                    if params['func'] is not _count_usage:
+                        # Services of _count_usage are found again by fallback
+                        failed.add(params['region'])
+                if params['region'] is None:
+                    del running[params['service']]
+                else:
+                    remaining[params['region']] -= 1
+
+            for region in list(remaining):
+                if remaining[region] > 0:
+                    continue
+                if any(pending is None or region in pending for pending in running.values()):
+                    continue
+                if count_only and region not in fallback:
+                    # Usage metric is not published, find by REGION_SERVICES
+                    fallback.add(region)
+                    with self.lock:
+                        found = set(self.result.get(region, {}))
+                    for service in USAGE_METRICS:
+                        if service not in found:
+                            submit(self._make_params(service, region, REGION_SERVICES[service]))
+                    if remaining[region] > 0:
+                        continue
+                del remaining[region]
+                if region in failed:
+                    _LOGGER.error(f'[_complete_regions] {region} is not emitted, since its task failed')
+                    with self.lock:
+                        self.result.pop(region, None)
+                    continue
+                yield region
+
+            if not running:
+                with self.lock:
+                    others = [region for region in self.result if region not in region_list]
+                yield from others
+
+    def _make_params(self, service, region, func):
+        """ params of find_service
+        """
+        return {
+            'service': service,
+            'region': region,
+            'session': self.session,
+            'func': func,
+            'result': self.result,
+            'lock': self.lock,
+            'timeline': self.timeline,
+            # Cassette answers requests by itself
+            'hedge': self.options.get('hedge', False) and self.cassette is None,
+            'account_id': self.account_id,
+            # Called by global task with regions it may still update
+            'pending': None
+        }
 
     def _find_all_regions(self, cred):
         """ Find all AWS regions based on EC2
@@ -433,12 +778,30 @@ def find_service(params):
                     'session': object,
                     'func': object,
                     'result': dict,
-                    'lock': Lock object
+                    'lock': Lock object,
+                    'timeline': Timeline object or None,
+                    'hedge': bool,
+                    'account_id': str,
+                    'pending': function(service, regions) or None
                 }
     """     
     #print(params)
-    client, resource = set_connect(params['session'], params['region'], params['service'])
-    r = params['func'](params['service'], client, resource)
+    start = time.perf_counter()
+    with phase(params['timeline'], f"{params['region'] or 'global'}/{params['service']}"):
+        client, resource = set_connect(params['session'], params['region'], params['service'])
+        if params['hedge'] and params['region'] is not None:
+            # Regional finders only call read-only describe/list APIs
+            get_hedger().install(client, params['region'])
+        r = params['func'](params['service'], client, resource)
+        if isinstance(r, types.GeneratorType):
+            # Global finder yields data, and regions it may still update
+            for data, pending in r:
+                update_global_result(params['result'], None, data, params['lock'])
+                params['pending'](params['service'], pending)
+            r = {}
+    elapsed = time.perf_counter() - start
+    get_latency_history().record(params['account_id'], params['region'], params['service'], elapsed)
+    COLLECTION_DURATION.observe(elapsed, account_id=params['account_id'], phase=params['service'])
     if params['region'] == None:
         update_global_result(params['result'], None, r, params['lock'])
     else:
@@ -563,16 +926,54 @@ def _prepare_resource_schema() -> dict:
     }
 
 if __name__ == "__main__":
-    import os
+    import argparse
+    from cloudone.inventory.lib.profiler import Timeline, SamplingProfiler, MemoryTracker
+    from cloudone.inventory.lib.cassette import Cassette
+
+    parser = argparse.ArgumentParser(description='Run SummaryConnector without gRPC server')
+    parser.add_argument('--count-only', action='store_true', help='count resources with aggregate APIs')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='write profile.folded (flamegraph), timeline.json (chrome trace) and memory.json to DIR')
+    parser.add_argument('--interval', type=float, default=0.005, help='sampling interval in seconds (default: 0.005)')
+    parser.add_argument('--record', metavar='CASSETTE', help='record AWS responses to cassette file')
+    parser.add_argument('--replay', metavar='CASSETTE', help='replay AWS responses from cassette file, no AWS access')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='scale of recorded latency at replay, 0 for no latency (default: 1.0)')
+    args = parser.parse_args()
+
     aki = os.environ.get('AWS_ACCESS_KEY_ID', "<YOUR_AWS_ACCESS_KEY_ID>")
     sak = os.environ.get('AWS_SECRET_ACCESS_KEY', "<YOUR_AWS_SECRET_ACCESS_KEY>")
     cred = {
         'aws_access_key_id': aki,
         'aws_secret_access_key': sak
     }
+    options = {'count_only': args.count_only}
+
+    def run(conn):
+        conn.verify(options, cred)
+        resource_stream = conn.collect_info(query={})
+        for resource in resource_stream:
+            print(resource)
+
     conn = SummaryConnector(Transaction(), cred)
-    conn.verify({}, cred)
-    resource_stream = conn.collect_info(query={})
-    for resource in resource_stream:
-        print(resource)
+    if args.record:
+        conn.cassette = Cassette(args.record, 'record')
+    elif args.replay:
+        conn.cassette = Cassette(args.replay, 'replay', args.latency_scale)
 
+    if args.profile is None:
+        run(conn)
+    else:
+        os.makedirs(args.profile, exist_ok=True)
+        conn.timeline = Timeline()
+        with MemoryTracker() as memory, SamplingProfiler(args.interval) as profiler:
+            run(conn)
+        profiler.dump(os.path.join(args.profile, 'profile.folded'))
+        conn.timeline.dump(os.path.join(args.profile, 'timeline.json'))
+        with open(os.path.join(args.profile, 'memory.json'), 'w') as f:
+            json.dump(memory.summary(), f)
+        pprint.pprint(conn.timeline.durations())
+        pprint.pprint(memory.summary())
+
+    if conn.cassette is not None:
+        conn.cassette.close()
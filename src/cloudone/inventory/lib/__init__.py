@@ -0,0 +1,10 @@
+from cloudone.inventory.lib.aggregator import ColumnAggregator, aggregate, to_key
+from cloudone.inventory.lib.profiler import Timeline, SamplingProfiler, MemoryTracker, phase
+from cloudone.inventory.lib.metrics import REGISTRY, start_metrics_server, instrument_session
+from cloudone.inventory.lib.scheduler import FairScheduler, get_scheduler
+from cloudone.inventory.lib.change_detector import ChangeDetector, get_change_detector, summary_hash
+from cloudone.inventory.lib.cassette import Cassette
+from cloudone.inventory.lib.hedge import LatencyTracker, HedgeBudget, Hedger, get_hedger
+from cloudone.inventory.lib.latency_history import LatencyHistory, get_latency_history
+from cloudone.inventory.lib.raw_parser import aggregate_in_process, get_parse_pool
+from cloudone.inventory.lib.s3_usage import bucket_usage, key_ranges, get_list_pool
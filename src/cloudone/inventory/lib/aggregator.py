@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['ColumnAggregator', 'aggregate', 'to_key']
+
+import logging
+
+from array import array
+from collections import Counter
+
+import jmespath
+
+_LOGGER = logging.getLogger(__name__)
+
+UNKNOWN = 'unknown'
+
+
+def to_key(value):
+    """ Make value usable as a summary key
+
+    We cannot use . as key, and missing fields are grouped as 'unknown'
+    """
+    if value is None:
+        return UNKNOWN
+    return str(value).replace('.', '-')
+
+
+class ColumnAggregator(object):
+    """ Columnar group-by counter
+
+    Only the requested fields are kept, one column buffer per field.
+    Each column is dictionary encoded: distinct values are stored once,
+    and every row costs one 32bit code per column.
+    Group-by counts are done over the code buffer at the end.
+    """
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns(list): column names, in the order of extracted rows
+                           empty list only counts rows
+        """
+        self.columns = list(columns)
+        self.rows = 0
+        self._codes = {name: array('I') for name in self.columns}
+        self._values = {name: {} for name in self.columns}
+
+    def add_rows(self, rows):
+        """ Append rows to column buffers
+
+        Args:
+            rows(list): list of tuple, each tuple is ordered by self.columns
+        """
+        if not rows:
+            return
+        for name, column in zip(self.columns, zip(*rows)):
+            values = self._values[name]
+            codes = self._codes[name]
+            for value in column:
+                code = values.get(value)
+                if code is None:
+                    code = len(values)
+                    values[value] = code
+                codes.append(code)
+        self.rows += len(rows)
+
+    def add_page(self, page, expression):
+        """ Extract rows from one API response page
+
+        Args:
+            page(dict): botocore response
+            expression: compiled jmespath expression, which returns list of rows
+                        multi-select list like 'Items[].[A, B]' keeps missing fields as None
+        """
+        self.add_rows(expression.search(page) or [])
+
+    def count(self, name):
+        """ Group-by count of one column
+
+        Returns: dict
+            {VALUE: Num of rows}
+        """
+        decode = {code: value for value, code in self._values[name].items()}
+        result = {}
+        for code, num in Counter(self._codes[name]).items():
+            key = to_key(decode[code])
+            result[key] = result.get(key, 0) + num
+        return result
+
+    def summary(self, columns=None):
+        """ Group-by count of columns
+
+        Returns: dict
+            {COLUMN: {VALUE: Num of rows}}
+        """
+        if columns is None:
+            columns = self.columns
+        return {name: self.count(name) for name in columns}
+
+
+def aggregate(client, operation, expression, columns, **kwargs):
+    """ Paginate operation and aggregate every page
+
+    Pages are dropped right after the columns are extracted.
+
+    Args:
+        client: boto3 client
+        operation(str): paginated operation name like 'describe_instances'
+        expression(str): jmespath expression for rows of columns, like 'Items[].[A, B]'
+        columns(list): column names
+
+    Returns: ColumnAggregator
+    """
+    agg = ColumnAggregator(columns)
+    compiled = jmespath.compile(expression)
+    paginator = client.get_paginator(operation)
+    for page in paginator.paginate(**kwargs):
+        agg.add_page(page, compiled)
+    return agg
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+""" Offline bulk collection to NDJSON, without gRPC server
+
+Input is a file with one account per line:
+    {"name": "dev", "aws_access_key_id": "...", "aws_secret_access_key": "..."}
+    {"name": "prod", "role_arn": "arn:aws:iam::123456789012:role/summary", "external_id": "..."}
+    arn:aws:iam::123456789012:role/summary
+
+Role ARNs are assumed with the default AWS credential chain.
+Source of account is its name, role ARN, or hash of access key ID.
+
+Output has one line per collect_info response, and one line when an account is finished:
+    {"source": "dev", "response": {...}}
+    {"source": "dev", "done": true, "responses": N}
+    {"source": "prod", "error": "..."}
+    {"source": "line:7", "error": "..."}         (invalid input line)
+
+Lines of one account are written at once, so with --resume,
+accounts which have "done" line are skipped and a partial tail is truncated.
+"""
+
+__all__ = ['main']
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from cloudone.core.transaction import Transaction
+from cloudone.inventory.connector.summary_connector import SummaryConnector
+
+_LOGGER = logging.getLogger(__name__)
+
+# Optional fields of an account line, strings if given
+OPTIONAL_FIELDS = ['name', 'aws_session_token', 'external_id']
+
+
+def _parse_account(line):
+    """ Parse one input line
+
+    Returns: dict or None
+
+    Raises: ValueError of invalid line
+    """
+    line = line.strip()
+    if line == '' or line.startswith('#'):
+        return None
+    if line.startswith('arn:'):
+        return {'role_arn': line}
+    account = json.loads(line)
+    if not isinstance(account, dict):
+        raise ValueError('account is not a JSON object')
+    if 'role_arn' in account:
+        required = ['role_arn']
+    elif 'aws_access_key_id' in account and 'aws_secret_access_key' in account:
+        required = ['aws_access_key_id', 'aws_secret_access_key']
+    else:
+        raise ValueError('account needs role_arn, or aws_access_key_id and aws_secret_access_key')
+    for field in required:
+        if not isinstance(account[field], str) or account[field] == '':
+            raise ValueError(f'{field} is not a non-empty string')
+    for field in OPTIONAL_FIELDS:
+        if account.get(field) is not None and not isinstance(account[field], str):
+            raise ValueError(f'{field} is not a string')
+    return account
+
+
+def _source_id(account):
+    """ Source of output lines, access key ID is never written
+    """
+    if account.get('name'):
+        return account['name']
+    if account.get('role_arn'):
+        return account['role_arn']
+    digest = hashlib.sha256(account['aws_access_key_id'].encode('utf-8')).hexdigest()
+    return f'key:{digest[:16]}'
+
+
+def _get_credentials(account):
+    """ Credentials of SummaryConnector
+
+    Returns: dict
+        {
+            'aws_access_key_id': str,
+            'aws_secret_access_key': str,
+            'aws_session_token': str or None
+        }
+    """
+    if 'role_arn' not in account:
+        return account
+
+    params = {
+        'RoleArn': account['role_arn'],
+        'RoleSessionName': 'aws-summary'
+    }
+    if 'external_id' in account:
+        params['ExternalId'] = account['external_id']
+    resp = boto3.Session().client('sts').assume_role(**params)
+    cred = resp['Credentials']
+    return {
+        'aws_access_key_id': cred['AccessKeyId'],
+        'aws_secret_access_key': cred['SecretAccessKey'],
+        'aws_session_token': cred['SessionToken']
+    }
+
+
+def _resume(path):
+    """ Find finished accounts, truncate partial lines after the last finished account
+
+    Returns: set of source id
+    """
+    done = set()
+    end = 0
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            offset += len(line)
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if record.get('done'):
+                done.add(record['source'])
+                end = offset
+            elif 'error' in record:
+                end = offset
+    with open(path, 'r+b') as f:
+        f.truncate(end)
+    return done
+
+
+class BatchWriter(object):
+    """ Write NDJSON lines of an account at once
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, lines):
+        data = ''.join(json.dumps(line, default=str) + '\n' for line in lines)
+        with self.lock:
+            self.stream.write(data)
+            self.stream.flush()
+
+
+def collect(account, options, writer):
+    """ Collect one account and write responses
+    """
+    source = _source_id(account)
+    try:
+        cred = _get_credentials(account)
+        conn = SummaryConnector(Transaction(), cred)
+        conn.verify(options, cred)
+        lines = []
+        for response in conn.collect_info(query={}):
+            lines.append({'source': source, 'response': response})
+        lines.append({'source': source, 'done': True, 'responses': len(lines)})
+        writer.write(lines)
+    except Exception as e:
+        _LOGGER.error(f'[collect] {source} failed: {e}')
+        writer.write([{'source': source, 'error': str(e)}])
+
+
+def run(lines, options, writer, concurrency, skip=None):
+    """ Collect accounts of input lines concurrently
+
+    At most concurrency accounts are collected or waiting at a time,
+    so input file is read lazily. Invalid line is written as error,
+    and the rest is collected.
+    """
+    skip = skip or set()
+    slots = threading.BoundedSemaphore(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for lineno, line in enumerate(lines, 1):
+            try:
+                account = _parse_account(line)
+            except ValueError as e:
+                _LOGGER.error(f'[run] invalid account at line {lineno}: {e}')
+                writer.write([{'source': f'line:{lineno}', 'error': f'invalid account: {e}'}])
+                continue
+            if account is None or _source_id(account) in skip:
+                continue
+            slots.acquire()
+            future = executor.submit(collect, account, options, writer)
+            future.add_done_callback(lambda f: slots.release())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Collect AWS summary of accounts to NDJSON')
+    parser.add_argument('accounts', help='file of credentials or role ARNs, one account per line')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='accounts collected at once (default: 4)')
+    parser.add_argument('--resume', action='store_true', help='skip accounts already finished in output file (needs -o)')
+    parser.add_argument('--count-only', action='store_true', help='count resources with aggregate APIs')
+    args = parser.parse_args(argv)
+    if args.resume and args.output is None:
+        parser.error('--resume needs -o/--output')
+
+    logging.basicConfig(level=logging.INFO)
+    options = {'count_only': args.count_only}
+
+    skip = set()
+    if args.output is None:
+        stream = sys.stdout
+    else:
+        if args.resume and os.path.exists(args.output):
+            skip = _resume(args.output)
+            _LOGGER.info(f'[main] resume, skip {len(skip)} accounts')
+        stream = open(args.output, 'a')
+
+    try:
+        with open(args.accounts) as f:
+            run(f, options, BatchWriter(stream), args.concurrency, skip)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+
+if __name__ == '__main__':
+    main()
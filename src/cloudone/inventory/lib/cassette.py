@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['Cassette']
+
+import base64
+import gzip
+import json
+import logging
+import re
+import threading
+import time
+
+from urllib.parse import urlsplit, parse_qs
+
+from botocore.awsrequest import AWSResponse
+from botocore.httpsession import URLLib3Session
+
+_LOGGER = logging.getLogger(__name__)
+
+VERSION = 1
+
+# Credentials in response body (like STS AssumeRole)
+_REDACT = [
+    (re.compile(rb'<(AccessKeyId|SecretAccessKey|SessionToken)>[^<]*</'), rb'<\1>REDACTED</'),
+    (re.compile(rb'"(AccessKeyId|SecretAccessKey|SessionToken|accessKeyId|secretAccessKey|sessionToken)"\s*:\s*"[^"]*"'),
+     rb'"\1": "REDACTED"'),
+]
+
+# Payload which collectors never read, and may hold secrets, is not recorded
+# like Lambda environment variables, tags and EC2 user data
+_STRIP_JSON = ['Environment', 'Tags', 'TagList', 'UserData']
+_STRIP_XML = re.compile(rb'<(tagSet|TagList|Tags|userData|UserData|MasterUsername)>.*?</\1>', re.DOTALL)
+
+# Only these response headers are recorded
+_HEADERS = ['content-type', 'x-amz-bucket-region']
+
+
+class _ReplayBody(object):
+    """ raw of AWSResponse
+    """
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+    def read(self, *args, **kwargs):
+        body, self.body = self.body, b''
+        return body
+
+
+def _request_keys(request):
+    """ Keys of AWS request
+
+    exact: method, url, X-Amz-Target and body
+    loose: method, url path, X-Amz-Target and Action, for requests with
+           volatile parameters (like StartTime of GetMetricData)
+
+    Request headers are never recorded, so Authorization is not in cassette.
+    """
+    target = request.headers.get('X-Amz-Target', b'')
+    if isinstance(target, bytes):
+        target = target.decode('utf-8')
+    body = request.body or b''
+    if hasattr(body, 'read'):
+        # Streaming body is not used by collectors
+        body = b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    exact = f'{request.method} {request.url} {target} ' + base64.b64encode(body).decode('ascii')
+
+    url = urlsplit(request.url)
+    action = parse_qs(url.query).get('Action') or parse_qs(body.decode('utf-8', 'replace')).get('Action') or ['']
+    loose = f'{request.method} {url.netloc}{url.path} {target} {action[0]}'
+    return exact, loose
+
+
+def _strip_json(data):
+    if isinstance(data, dict):
+        return {k: _strip_json(v) for k, v in data.items() if k not in _STRIP_JSON}
+    if isinstance(data, list):
+        return [_strip_json(v) for v in data]
+    return data
+
+
+def _redact(body):
+    """ Response body without credentials and payload of _STRIP_JSON, _STRIP_XML
+    """
+    if body.lstrip()[:1] == b'{':
+        try:
+            body = json.dumps(_strip_json(json.loads(body))).encode('utf-8')
+        except ValueError:
+            pass
+    else:
+        body = _STRIP_XML.sub(b'', body)
+    for pattern, replace in _REDACT:
+        body = pattern.sub(replace, body)
+    return body
+
+
+class Cassette(object):
+    """ Record and replay AWS HTTP responses of boto3 session
+
+    Cassette file is gzip compressed NDJSON, the first line is header:
+        {"version": 1, "created": TIMESTAMP}
+        {"key": EXACT_KEY, "loose": LOOSE_KEY, "status": 200, "headers": {...},
+         "body": TEXT, "base64": false, "latency": SECONDS}
+        ...
+
+    record: every request is sent to AWS, and the response is appended to cassette
+    replay: no request is sent, response is found by request key and returned after
+            recorded latency * latency_scale. Same request gets recorded responses in order.
+    """
+
+    def __init__(self, path, mode='replay', latency_scale=1.0):
+        """
+        Args:
+            path(str): cassette file
+            mode(str): 'record' | 'replay'
+            latency_scale(float): 0 replays without latency
+        """
+        if mode not in ('record', 'replay'):
+            raise ValueError(f'unknown cassette mode: {mode}')
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.loose = {}
+        self.cursor = {}
+        self.misses = 0
+        self._file = None
+        self._http = None
+
+        if mode == 'record':
+            self._http = URLLib3Session()
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+            self._file.write(json.dumps({'version': VERSION, 'created': time.time()}) + '\n')
+        else:
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != VERSION:
+                raise ValueError(f'unsupported cassette version: {header.get("version")}')
+            for line in f:
+                entry = json.loads(line)
+                self.entries.setdefault(entry['key'], []).append(entry)
+                self.loose.setdefault(entry['loose'], []).append(entry)
+
+    def install(self, session):
+        """ Hook boto3 session, call before clients are created
+        """
+        session.events.register('before-send', self._before_send)
+
+    def close(self):
+        if self._file is not None:
+            with self.lock:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _before_send(self, request, **kwargs):
+        if self.mode == 'record':
+            return self._record(request)
+        return self._replay(request)
+
+    def _record(self, request):
+        start = time.perf_counter()
+        response = self._http.send(request)
+        body = response.content
+        latency = time.perf_counter() - start
+
+        body = _redact(body)
+        try:
+            text, is_base64 = body.decode('utf-8'), False
+        except UnicodeDecodeError:
+            text, is_base64 = base64.b64encode(body).decode('ascii'), True
+
+        exact, loose = _request_keys(request)
+        entry = {
+            'key': exact,
+            'loose': loose,
+            'status': response.status_code,
+            'headers': {k: response.headers[k] for k in _HEADERS if k in response.headers},
+            'body': text,
+            'base64': is_base64,
+            'latency': latency
+        }
+        with self.lock:
+            self._file.write(json.dumps(entry) + '\n')
+        return response
+
+    def _next_entry(self, request):
+        exact, loose = _request_keys(request)
+        with self.lock:
+            for key, table in ((exact, self.entries), (loose, self.loose)):
+                entries = table.get(key)
+                if entries:
+                    idx = self.cursor.get(key, 0)
+                    self.cursor[key] = idx + 1
+                    # Same request more than recorded gets the last response
+                    return entries[min(idx, len(entries) - 1)]
+            self.misses += 1
+        return None
+
+    def _replay(self, request):
+        entry = self._next_entry(request)
+        if entry is None:
+            _LOGGER.error(f'[_replay] not in cassette: {request.method} {request.url}')
+            raise KeyError(f'request is not in cassette: {request.method} {request.url}')
+
+        if self.latency_scale > 0:
+            time.sleep(entry['latency'] * self.latency_scale)
+
+        if entry['base64']:
+            body = base64.b64decode(entry['body'])
+        else:
+            body = entry['body'].encode('utf-8')
+        return AWSResponse(request.url, entry['status'], entry['headers'], _ReplayBody(body))
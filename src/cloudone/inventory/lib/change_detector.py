@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['ChangeDetector', 'get_change_detector', 'requester_hash', 'summary_hash']
+
+import hashlib
+import json
+import logging
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+_DETECTOR = None
+_DETECTOR_LOCK = threading.Lock()
+
+
+def summary_hash(summary):
+    """ Stable hash of region summary
+
+    Key order does not change the hash.
+    """
+    data = json.dumps(summary, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def requester_hash(options, credentials):
+    """ Hash of who collects, credentials and options
+
+    Collectors of the same AWS account with other credentials
+    or options have their own last emitted summaries.
+    """
+    data = json.dumps([options, credentials], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ChangeDetector(object):
+    """ Last emitted summary hash per (requester, account_id, region)
+
+    Hashes are kept in memory of this process, so after restart
+    every region is emitted once again.
+    """
+
+    def __init__(self):
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    def is_changed(self, requester, account_id, region, digest):
+        with self.lock:
+            return self.hashes.get((requester, account_id, region)) != digest
+
+    def update(self, requester, account_id, region, digest):
+        """ Record digest, call after the response is emitted
+        """
+        with self.lock:
+            self.hashes[(requester, account_id, region)] = digest
+
+
+def get_change_detector():
+    global _DETECTOR
+    with _DETECTOR_LOCK:
+        if _DETECTOR is None:
+            _DETECTOR = ChangeDetector()
+        return _DETECTOR
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['LatencyTracker', 'HedgeBudget', 'Hedger', 'get_hedger']
+
+import functools
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+
+from cloudone.inventory.lib.scheduler import DEFAULT_MAX_WORKERS
+
+from cloudone.core import config
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PERCENTILE = 0.95
+DEFAULT_BUDGET_RATIO = 0.05
+DEFAULT_WORKERS = 48
+# Hedge is not sent until enough latency is learned
+MIN_SAMPLES = 10
+MAX_SAMPLES = 200
+MAX_BURST = 5
+
+_HEDGER = None
+_HEDGER_LOCK = threading.Lock()
+
+
+class LatencyTracker(object):
+    """ Recent latency per key, like (service, region)
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, seconds):
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None:
+                samples = deque(maxlen=self.max_samples)
+                self.samples[key] = samples
+            samples.append(seconds)
+
+    def percentile(self, key, q):
+        """ Latency at percentile q (0 ~ 1), None if not learned yet
+        """
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None or len(samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class HedgeBudget(object):
+    """ Token bucket of hedges
+
+    Every primary call deposits ratio token, a hedge takes one token.
+    So hedges are at most ratio of calls, plus a small burst.
+    """
+
+    def __init__(self, ratio=DEFAULT_BUDGET_RATIO, burst=MAX_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.tokens + self.ratio, self.burst)
+
+    def available(self):
+        with self.lock:
+            return self.tokens >= 1
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class Hedger(object):
+    """ Hedged AWS API calls
+
+    Installed to a client, every HTTP request of the client is sent by
+    hedger, with the HTTP session of the client (proxy, CA bundle and
+    timeouts of client config). When a request runs past the learned
+    latency percentile of its operation and region, the same signed
+    request is sent again and the first successful response is used.
+    Each page of a paginated call is hedged by itself.
+
+    Request is sent on the caller thread, until latency is learned or
+    while hedge budget is empty. Otherwise it is sent on a primary
+    thread, so that the caller can return the response of a hedge.
+    Primary threads are as many as scheduler workers (callers), so
+    primaries never wait in queue. Hedges run on at most workers threads.
+    The slower attempt is left running and its response is dropped.
+    """
+
+    def __init__(self, percentile=DEFAULT_PERCENTILE, budget_ratio=DEFAULT_BUDGET_RATIO, workers=DEFAULT_WORKERS,
+                 primary_workers=DEFAULT_MAX_WORKERS):
+        self.percentile = percentile
+        self.tracker = LatencyTracker()
+        self.budget = HedgeBudget(budget_ratio)
+        self.primaries = ThreadPoolExecutor(max_workers=primary_workers, thread_name_prefix='hedge-primary')
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+        self.hedges = 0
+        self.wins = 0
+
+    def install(self, client, region):
+        """ Hedge requests of client, call for read-only (describe/list) client only
+        """
+        http_session = client._endpoint.http_session
+        client.meta.events.register('before-send',
+                                    functools.partial(self._before_send, region=region, http_session=http_session))
+
+    def _before_send(self, request, event_name, region, http_session, **kwargs):
+        # before-send.SERVICE.OPERATION
+        return self.call((event_name, region), functools.partial(self._send, http_session, request))
+
+    @staticmethod
+    def _send(http_session, request):
+        response = http_session.send(request)
+        # Whole body is read by the attempt
+        response.content
+        return response
+
+    def call(self, key, fn):
+        """
+        Args:
+            key: latency key, like (operation, region)
+            fn: read-only function without argument, called once or twice
+
+        Returns: result of fn
+        """
+        self.budget.deposit()
+        threshold = self.tracker.percentile(key, self.percentile)
+
+        def primary():
+            start = time.perf_counter()
+            result = fn()
+            # Only primary latency is learned, hedge would bias it
+            self.tracker.add(key, time.perf_counter() - start)
+            return result
+
+        if threshold is None or not self.budget.available():
+            return primary()
+
+        started = threading.Event()
+
+        def timed_primary():
+            started.set()
+            return primary()
+
+        first = self.primaries.submit(timed_primary)
+        # Threshold is measured from the start of the request
+        started.wait()
+        try:
+            return first.result(timeout=threshold)
+        except TimeoutError:
+            pass
+        if not self.budget.withdraw():
+            return first.result()
+
+        _LOGGER.debug(f'[call] hedge {key} after {threshold:.3f}s')
+        self.hedges += 1
+        second = self.executor.submit(fn)
+        done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = first if first in done else second
+        if winner.exception() is not None:
+            # First one failed, wait for the other
+            winner = second if winner is first else first
+        if winner is second:
+            self.wins += 1
+        return winner.result()
+
+
+def get_hedger():
+    """ Hedger of this process
+
+    Latency and budget are shared by all collections
+    """
+    global _HEDGER
+    with _HEDGER_LOCK:
+        if _HEDGER is None:
+            _HEDGER = Hedger(config.get_global('HEDGE_PERCENTILE', DEFAULT_PERCENTILE),
+                             config.get_global('HEDGE_BUDGET_RATIO', DEFAULT_BUDGET_RATIO),
+                             config.get_global('HEDGE_WORKERS', DEFAULT_WORKERS),
+                             config.get_global('MAX_WORKERS', DEFAULT_MAX_WORKERS))
+        return _HEDGER
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['LatencyHistory', 'get_latency_history']
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from cloudone.core import config
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PATH = '/tmp/aws-summary/latency_history.json'
+# Weight of the latest latency
+ALPHA = 0.3
+
+_HISTORY = None
+_HISTORY_LOCK = threading.Lock()
+
+
+class LatencyHistory(object):
+    """ Expected latency per (account, region, service)
+
+    Latency is exponentially weighted moving average of task seconds,
+    persisted to JSON file so that it survives plugin restart.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path(str): JSON file, None keeps history in memory only
+        """
+        self.path = path
+        self.latency = {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def _key(account_id, region, service):
+        return f'{account_id}/{region or "global"}/{service}'
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self.latency = json.load(f)
+        except (OSError, ValueError) as e:
+            _LOGGER.error(f'[_load] ignore latency history {self.path}: {e}')
+
+    def save(self):
+        """ Write history to file, concurrent collections save one at a time
+        """
+        if self.path is None:
+            return
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(self.latency)
+            tmp = None
+            try:
+                directory = os.path.dirname(self.path)
+                os.makedirs(directory, exist_ok=True)
+                # Unique temp file, in the same directory for atomic replace
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix='.latency_history.', suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                _LOGGER.error(f'[save] failed to save latency history {self.path}: {e}')
+                if tmp is not None and os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def expected(self, account_id, region, service):
+        """ Expected seconds, None if never recorded
+        """
+        with self.lock:
+            return self.latency.get(self._key(account_id, region, service))
+
+    def record(self, account_id, region, service, seconds):
+        key = self._key(account_id, region, service)
+        with self.lock:
+            previous = self.latency.get(key)
+            if previous is None:
+                self.latency[key] = seconds
+            else:
+                self.latency[key] = ALPHA * seconds + (1 - ALPHA) * previous
+
+    def longest_first(self, account_id, tasks):
+        """ Sort find_service params by expected latency, longest first
+
+        Tasks never recorded go first, since they may be long.
+        """
+        def expected(params):
+            seconds = self.expected(account_id, params['region'], params['service'])
+            return float('inf') if seconds is None else seconds
+        return sorted(tasks, key=expected, reverse=True)
+
+
+def get_latency_history():
+    """ Latency history of this process
+
+    File is LATENCY_HISTORY_PATH of global config
+    """
+    global _HISTORY
+    with _HISTORY_LOCK:
+        if _HISTORY is None:
+            _HISTORY = LatencyHistory(config.get_global('LATENCY_HISTORY_PATH', DEFAULT_PATH))
+        return _HISTORY
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'REGISTRY', 'start_metrics_server', 'instrument_session',
+           'COLLECTIONS', 'COLLECTION_DURATION', 'API_CALLS', 'API_THROTTLES',
+           'CACHE_REQUESTS', 'S3_BYTES_SCANNED', 'S3_OBJECTS_SCANNED']
+
+import contextlib
+import logging
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cloudone.core import config
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+THROTTLE_CODES = ['Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+                  'TooManyRequestsException', 'RequestLimitExceeded', 'SlowDown', 'RequestThrottled',
+                  'ProvisionedThroughputExceededException', 'BandwidthLimitExceeded']
+
+_SERVER = None
+_SERVER_LOCK = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    if not pairs:
+        return ''
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        with self.lock:
+            return [f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in self.values.items()]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """ Gauge, value is set or read from callback at scrape
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.callback is not None:
+            return [f'{self.name} {self.callback()}']
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            sample = self.values.get(key)
+            if sample is None:
+                # [count per bucket, sum, count]
+                sample = [[0] * len(self.buckets), 0, 0]
+                self.values[key] = sample
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[0][idx] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                for bound, num in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, ("le", bound))} {num}')
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, ("le", "+Inf"))} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+COLLECTIONS = REGISTRY.register(Counter(
+    'aws_summary_collections_total', 'Finished collections', ['state']))
+COLLECTION_DURATION = REGISTRY.register(Histogram(
+    'aws_summary_collection_duration_seconds', 'Duration of collection phases', ['account_id', 'phase']))
+API_CALLS = REGISTRY.register(Counter(
+    'aws_summary_api_calls_total', 'AWS API calls including retries', ['service', 'operation']))
+API_THROTTLES = REGISTRY.register(Counter(
+    'aws_summary_api_throttles_total', 'Throttled AWS API calls', ['service', 'operation']))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'aws_summary_cache_requests_total', 'Requests of stale_while_revalidate cache', ['result']))
+S3_BYTES_SCANNED = REGISTRY.register(Counter(
+    'aws_summary_s3_bytes_scanned_total', 'Size of S3 objects listed'))
+S3_OBJECTS_SCANNED = REGISTRY.register(Counter(
+    'aws_summary_s3_objects_scanned_total', 'Number of S3 objects listed'))
+
+
+def _on_needs_retry(event_name, response=None, **kwargs):
+    """ Count every attempt of AWS API call
+
+    needs-retry is emitted once per attempt, with (http_response, parsed)
+    """
+    _, service, operation = event_name.split('.', 2)
+    API_CALLS.inc(service=service, operation=operation)
+    if response is None:
+        return None
+    code = response[1].get('Error', {}).get('Code')
+    if code in THROTTLE_CODES:
+        API_THROTTLES.inc(service=service, operation=operation)
+    # Never changes retry decision
+    return None
+
+
+def instrument_session(session):
+    """ Count API calls of boto3 session, call before clients are created
+    """
+    session.events.register('needs-retry', _on_needs_retry)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        _LOGGER.debug(f'[metrics] {format % args}')
+
+
+def start_metrics_server():
+    """ Serve /metrics at METRICS_PORT of global config, None (default) disables it
+
+    Starts once per process. Failure is logged, and never raised.
+    """
+    global _SERVER
+    with _SERVER_LOCK:
+        if _SERVER is not None:
+            return
+        port = config.get_global('METRICS_PORT', None)
+        if port is None:
+            return
+        try:
+            _SERVER = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+        except OSError as e:
+            # Plugin works without metrics
+            _LOGGER.error(f'[start_metrics_server] failed to serve /metrics at {port}: {e}')
+            return
+        _SERVER.daemon_threads = True
+        threading.Thread(target=_SERVER.serve_forever, name='metrics-server', daemon=True).start()
+        _LOGGER.info(f'[start_metrics_server] serve /metrics at {port}')
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['Timeline', 'SamplingProfiler', 'MemoryTracker', 'phase']
+
+import contextlib
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from collections import Counter
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def phase(timeline, name):
+    """ Context manager of timeline phase, nothing if timeline is None
+    """
+    if timeline is None:
+        return contextlib.nullcontext()
+    return timeline.phase(name)
+
+
+class Timeline(object):
+    """ Per-phase timeline of collection
+
+    Phases can be recorded from any thread.
+    Output is Chrome trace event format, which can be opened by
+    chrome://tracing, Perfetto or speedscope.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.thread_names = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            ident = threading.get_ident()
+            # list.append is thread safe
+            self.events.append((name, ident, start, end))
+            self.thread_names[ident] = threading.current_thread().name
+
+    def durations(self):
+        """ Total seconds per phase name
+
+        Returns: dict
+            {PHASE_NAME: seconds}
+        """
+        result = {}
+        for name, ident, start, end in self.events:
+            result[name] = result.get(name, 0) + (end - start)
+        return result
+
+    def dump(self, path):
+        pid = os.getpid()
+        trace_events = []
+        for ident, thread_name in self.thread_names.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident,
+                                 'args': {'name': thread_name}})
+        for name, ident, start, end in self.events:
+            trace_events.append({
+                'name': name,
+                'ph': 'X',
+                'pid': pid,
+                'tid': ident,
+                'ts': (start - self.origin) * 1000000,
+                'dur': (end - start) * 1000000
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+
+class SamplingProfiler(object):
+    """ Sampling profiler of all threads
+
+    Collection runs on many threads, so every thread stack is sampled
+    at interval. Output is folded stack format of flamegraph.pl
+    (also accepted by speedscope).
+    """
+
+    def __init__(self, interval=0.005):
+        """
+        Args:
+            interval(float): sampling interval in seconds
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stack.reverse()
+                self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class MemoryTracker(object):
+    """ Peak memory of collection
+
+    traced: peak of python allocations (tracemalloc)
+    rss: peak resident set size of process
+    """
+
+    def __init__(self):
+        self.peak_traced = 0
+        self.peak_rss = 0
+
+    def __enter__(self):
+        tracemalloc.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        current, self.peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # ru_maxrss is KB on Linux
+        self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def summary(self):
+        return {
+            'peak_traced(MB)': self.peak_traced / 1024 / 1024,
+            'peak_rss(MB)': self.peak_rss / 1024 / 1024
+        }
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['aggregate_in_process', 'get_parse_pool',
+           'parse_ec2_instances', 'parse_rds_clusters', 'parse_rds_instances']
+
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from cloudone.core import config
+
+from cloudone.inventory.lib.aggregator import to_key
+
+_LOGGER = logging.getLogger(__name__)
+
+# Pages in parse processes (queued or parsing) per parse worker
+PENDING_PAGES_PER_WORKER = 2
+
+_POOL = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+################################################
+# Run in parse process
+# Only compact counts are returned
+################################################
+def _namespace(root):
+    if root.tag.startswith('{'):
+        return root.tag[:root.tag.index('}') + 1]
+    return ''
+
+
+def _count_rows(body, path, columns):
+    """ Group-by count of XML response
+
+    Args:
+        body(bytes): raw XML response
+        path(str): path of row elements, {ns} is replaced by namespace
+        columns(dict): {COLUMN: path of value in row}
+
+    Returns: dict
+        {
+            'rows': N,
+            'counts': {COLUMN: {VALUE: Num of rows}}
+        }
+    """
+    root = ET.fromstring(body)
+    ns = _namespace(root)
+    counts = {name: {} for name in columns}
+    rows = 0
+    for row in root.iterfind(path.format(ns=ns)):
+        rows += 1
+        for name, value_path in columns.items():
+            value = row.findtext(value_path.format(ns=ns))
+            per_value = counts[name]
+            per_value[value] = per_value.get(value, 0) + 1
+    return {'rows': rows, 'counts': counts}
+
+
+def parse_ec2_instances(body):
+    return _count_rows(body, '{ns}reservationSet/{ns}item/{ns}instancesSet/{ns}item', {
+        'type': '{ns}instanceType',
+        'state': '{ns}instanceState/{ns}name',
+        'availability_zone': '{ns}placement/{ns}availabilityZone'
+    })
+
+
+def parse_rds_clusters(body):
+    return _count_rows(body, '{ns}DescribeDBClustersResult/{ns}DBClusters/{ns}DBCluster', {
+        'engine': '{ns}Engine'
+    })
+
+
+def parse_rds_instances(body):
+    return _count_rows(body, '{ns}DescribeDBInstancesResult/{ns}DBInstances/{ns}DBInstance', {
+        'engine': '{ns}Engine'
+    })
+
+
+################################################
+# Run in collector thread
+################################################
+class _RawPages(object):
+    """ Keep raw body of botocore response, instead of parsing it in thread
+
+    before-parse hook takes the raw body, and gives botocore an empty
+    result with only the pagination token, so botocore parsing is cheap.
+    """
+
+    def __init__(self, client, operation_name, token_name):
+        self.client = client
+        self.operation_name = operation_name
+        self.token_name = token_name
+        self.token = re.compile(f'<{token_name[0].lower()}{token_name[1:]}>([^<]*)</|<{token_name}>([^<]*)</'.encode())
+        self.local = threading.local()
+        service_id = client.meta.service_model.service_id.hyphenize()
+        self.event = f'before-parse.{service_id}.{operation_name}'
+
+    def __enter__(self):
+        self.client.meta.events.register(self.event, self._before_parse)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.client.meta.events.unregister(self.event, self._before_parse)
+
+    def _before_parse(self, response_dict, customized_response_dict, **kwargs):
+        if response_dict['status_code'] != 200:
+            return
+        body = response_dict['body']
+        self.local.body = body
+        match = None
+        for match in self.token.finditer(body):
+            pass
+        if match is not None:
+            token = (match.group(1) or match.group(2) or b'').decode('utf-8')
+            if token:
+                customized_response_dict[self.token_name] = token
+        # Query protocol looks for {Operation}Result element
+        response_dict['body'] = f'<Response><{self.operation_name}Result/></Response>'.encode()
+
+    def bodies(self, method, **params):
+        """ Call method page by page, yield raw body
+        """
+        while True:
+            resp = method(**params)
+            yield self.local.body
+            token = resp.get(self.token_name)
+            if not token:
+                return
+            params[self.token_name] = token
+
+
+def aggregate_in_process(client, method_name, operation_name, token_name, parser, **params):
+    """ Fetch pages in this thread, parse and count in parse process
+
+    Args:
+        client: boto3 client of query protocol (ec2, rds)
+        method_name(str): like 'describe_instances'
+        operation_name(str): like 'DescribeInstances'
+        token_name(str): pagination parameter, 'NextToken' or 'Marker'
+        parser: parse function of this module
+
+    Returns: dict
+        {
+            'rows': N,
+            'counts': {COLUMN: {VALUE: Num of rows}}
+        }
+
+    Fetching waits while PENDING_PAGES_PER_WORKER pages per parse worker
+    are pending, so raw pages are not piled up when parsing is slower.
+    """
+    pool = get_parse_pool()
+    max_pending = PENDING_PAGES_PER_WORKER * _POOL_WORKERS
+    result = {'rows': 0, 'counts': {}}
+    pending = set()
+    with _RawPages(client, operation_name, token_name) as pages:
+        for body in pages.bodies(getattr(client, method_name), **params):
+            # Next page is fetched while this page is parsed
+            pending.add(pool.submit(parser, body))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _merge_pages(result, done)
+
+    _merge_pages(result, pending)
+    return result
+
+
+def _merge_pages(result, futures):
+    counts = result['counts']
+    for future in futures:
+        page = future.result()
+        result['rows'] += page['rows']
+        for name, per_value in page['counts'].items():
+            merged = counts.setdefault(name, {})
+            for value, num in per_value.items():
+                key = to_key(value)
+                merged[key] = merged.get(key, 0) + num
+
+
+def get_parse_pool():
+    """ Parse processes of this process
+
+    Number of processes is PARSE_WORKERS of global config (default: CPU count).
+    Processes are spawned, since fork is not safe with collector threads.
+    """
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL_WORKERS = config.get_global('PARSE_WORKERS', None) or os.cpu_count()
+            _POOL = ProcessPoolExecutor(max_workers=_POOL_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _POOL
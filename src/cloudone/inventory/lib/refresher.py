@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['SummaryRefresher', 'get_refresher']
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudone.core import config
+from cloudone.core.transaction import Transaction
+
+from cloudone.inventory.connector.summary_connector import SummaryConnector
+from cloudone.inventory.lib.metrics import CACHE_REQUESTS
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 300
+DEFAULT_INTERVAL = 600
+DEFAULT_JITTER = 0.1
+DEFAULT_CONCURRENCY = 2
+# Account which is not requested for this seconds is not refreshed any more
+DEFAULT_EXPIRE = 86400
+# Options of refresher itself, not passed to SummaryConnector
+REFRESHER_OPTIONS = ['stale_while_revalidate', 'max_age']
+
+_REFRESHER = None
+_REFRESHER_LOCK = threading.Lock()
+
+
+def collect_summary(options, credentials):
+    """ Collect all responses of an account
+
+    Returns: list
+    """
+    conn = SummaryConnector(Transaction(), credentials)
+    conn.verify(options, credentials)
+    return list(conn.collect_info(query={}))
+
+
+class _Entry(object):
+    def __init__(self, options, credentials):
+        self.options = options
+        self.credentials = credentials
+        self.responses = None
+        self.updated_at = 0
+        self.next_refresh = 0
+        self.requested_at = time.time()
+        self.refreshing = False
+        # First collection is run once, concurrent first requests wait for it
+        self.first_lock = threading.Lock()
+        self.error = None
+
+
+class SummaryRefresher(object):
+    """ Latest summary of registered accounts, refreshed in background
+
+    An account is registered at its first request, which is collected right away.
+    After that, requests get the latest completed summary at once,
+    and a refresh is started when the summary is older than max_age.
+    Registered accounts are also refreshed every interval (with jitter),
+    at most concurrency collections at a time.
+
+    Credentials of registered accounts are kept in memory of this process.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER,
+                 concurrency=DEFAULT_CONCURRENCY, expire=DEFAULT_EXPIRE):
+        self.interval = interval
+        self.jitter = jitter
+        self.expire = expire
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='summary-refresher')
+        self._thread = threading.Thread(target=self._run, name='summary-refresher-scheduler', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _key(options, credentials):
+        data = json.dumps([options, credentials], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, options, credentials):
+        """ Latest responses of account
+
+        Returns: list
+        """
+        max_age = options.get('max_age', DEFAULT_MAX_AGE)
+        options = {k: v for k, v in options.items() if k not in REFRESHER_OPTIONS}
+        # Cached responses must have every region
+        options['change_detection'] = False
+        key = self._key(options, credentials)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = _Entry(options, credentials)
+                self.entries[key] = entry
+            entry.requested_at = time.time()
+
+        if entry.responses is None:
+            with entry.first_lock:
+                if entry.error is not None:
+                    # First collection, which this request waited for, failed
+                    raise entry.error
+                if entry.responses is None:
+                    # First request of account is collected right away
+                    CACHE_REQUESTS.inc(result='miss')
+                    try:
+                        self._refresh(entry)
+                    except Exception as e:
+                        entry.error = e
+                        with self.lock:
+                            self.entries.pop(key, None)
+                        raise
+                    return entry.responses
+
+        if time.time() - entry.updated_at > max_age:
+            CACHE_REQUESTS.inc(result='stale')
+            self._submit(entry)
+        else:
+            CACHE_REQUESTS.inc(result='hit')
+        return entry.responses
+
+    def _submit(self, entry):
+        with self.lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+        self.executor.submit(self._refresh, entry, True)
+
+    def _refresh(self, entry, submitted=False):
+        """ Collect account, error of background refresh keeps the last summary
+        """
+        try:
+            responses = collect_summary(entry.options, entry.credentials)
+            entry.responses = responses
+            entry.updated_at = time.time()
+        except Exception as e:
+            _LOGGER.error(f'[_refresh] summary collection failed: {e}')
+            if not submitted:
+                raise
+        finally:
+            with self.lock:
+                if submitted:
+                    entry.refreshing = False
+                entry.next_refresh = time.time() + self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _run(self):
+        while True:
+            time.sleep(1)
+            now = time.time()
+            due = []
+            with self.lock:
+                for key, entry in list(self.entries.items()):
+                    if now - entry.requested_at > self.expire:
+                        del self.entries[key]
+                    elif entry.responses is not None and now >= entry.next_refresh:
+                        due.append(entry)
+            for entry in due:
+                self._submit(entry)
+
+
+def get_refresher():
+    """ Refresher of this process
+
+    REFRESH_INTERVAL, REFRESH_JITTER, REFRESH_CONCURRENCY and REFRESH_EXPIRE of global config
+    """
+    global _REFRESHER
+    with _REFRESHER_LOCK:
+        if _REFRESHER is None:
+            _REFRESHER = SummaryRefresher(config.get_global('REFRESH_INTERVAL', DEFAULT_INTERVAL),
+                                          config.get_global('REFRESH_JITTER', DEFAULT_JITTER),
+                                          config.get_global('REFRESH_CONCURRENCY', DEFAULT_CONCURRENCY),
+                                          config.get_global('REFRESH_EXPIRE', DEFAULT_EXPIRE))
+        return _REFRESHER
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['bucket_usage', 'key_ranges', 'get_list_pool']
+
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudone.core import config
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 16
+MAX_PARTITIONS = 64
+# Pages listed before bucket is split, boundary discovery costs more for small bucket
+SEQUENTIAL_PAGES = 10
+# Characters of key prefix discovered at most, like 'data-0'
+MAX_DEPTH = 32
+# ListObjectsV2 calls for boundary discovery of one bucket
+MAX_PROBES = 512
+# Skips all keys which start with prefix, in S3 (UTF-8) key order
+MAX_CHAR = '\U0010ffff'
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _sum_contents(contents, upper=None):
+    """ Count and size of objects, up to upper key (inclusive)
+
+    Returns: (count, size, reached upper)
+    """
+    count = 0
+    size = 0
+    for obj in contents:
+        if upper is not None and obj['Key'] > upper:
+            return count, size, True
+        count += 1
+        size += obj['Size']
+    return count, size, False
+
+
+class _Prober(object):
+    """ Distinct next characters of keys under prefix
+
+    Every probe is a ListObjectsV2 of one key, then all keys of
+    the found character are skipped by StartAfter.
+    """
+
+    def __init__(self, client, bucket_name):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.probes = 0
+
+    def next_chars(self, prefix, limit):
+        chars = []
+        start_after = None
+        while len(chars) < limit and self.probes < MAX_PROBES:
+            params = {'Bucket': self.bucket_name, 'Prefix': prefix, 'MaxKeys': 1}
+            if start_after is not None:
+                params['StartAfter'] = start_after
+            self.probes += 1
+            contents = self.client.list_objects_v2(**params).get('Contents', [])
+            if not contents:
+                break
+            key = contents[0]['Key']
+            if len(key) == len(prefix):
+                start_after = key
+                continue
+            char = key[len(prefix)]
+            chars.append(prefix + char)
+            start_after = prefix + char + MAX_CHAR
+        return chars
+
+
+def _boundaries(client, bucket_name, target=MAX_PARTITIONS):
+    """ Boundary keys of bucket, discovered from its key prefixes
+
+    Prefixes are split one character deeper, level by level, until
+    there are target prefixes (key_ranges picks evenly from more).
+    Long shared prefixes like 'logs/2020/' or 'data-' cost two probes
+    per character.
+    """
+    prober = _Prober(client, bucket_name)
+    prefixes = ['']
+    for _ in range(MAX_DEPTH):
+        expanded = []
+        for idx, prefix in enumerate(prefixes):
+            if prober.probes >= MAX_PROBES:
+                # Rest is kept unsplit
+                expanded.extend(prefixes[idx:])
+                break
+            expanded.extend(prober.next_chars(prefix, target))
+        if expanded == prefixes:
+            break
+        prefixes = expanded
+        if len(prefixes) >= target or prober.probes >= MAX_PROBES:
+            break
+    _LOGGER.debug(f'[_boundaries] {bucket_name}: {len(prefixes)} boundaries by {prober.probes} probes')
+    return prefixes
+
+
+def key_ranges(boundaries, max_partitions=MAX_PARTITIONS):
+    """ Key ranges which cover whole key space
+
+    Ranges are (lower, upper]: keys after lower (exclusive) up to upper (inclusive),
+    None is unbounded. So every key is in exactly one range,
+    even if boundaries are not keys.
+
+    Returns: list of (lower, upper)
+    """
+    boundaries = sorted(set(boundaries))
+    if len(boundaries) >= max_partitions:
+        step = len(boundaries) / (max_partitions - 1)
+        boundaries = [boundaries[int(i * step)] for i in range(max_partitions - 1)]
+    lowers = [None] + boundaries
+    uppers = boundaries + [None]
+    return list(zip(lowers, uppers))
+
+
+def _list_range(client, bucket_name, lower, upper):
+    """ Count and size of objects in (lower, upper]
+
+    Returns: (count, size)
+    """
+    params = {'Bucket': bucket_name}
+    if lower is not None:
+        params['StartAfter'] = lower
+    total_count = 0
+    total_size = 0
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(**params):
+        count, size, done = _sum_contents(page.get('Contents', []), upper)
+        total_count += count
+        total_size += size
+        if done:
+            break
+    return total_count, total_size
+
+
+def bucket_usage(client, bucket_name):
+    """ Exact number of objects and size of bucket
+
+    Bucket of SEQUENTIAL_PAGES pages is counted page by page. Rest of bigger
+    bucket is split into key ranges by its key prefixes,
+    which are listed in parallel at S3 listing threads and merged.
+
+    Returns: (count, size in bytes)
+    """
+    count = 0
+    size = 0
+    params = {'Bucket': bucket_name, 'MaxKeys': 1000}
+    for _ in range(SEQUENTIAL_PAGES):
+        resp = client.list_objects_v2(**params)
+        contents = resp.get('Contents', [])
+        page_count, page_size, _ = _sum_contents(contents)
+        count += page_count
+        size += page_size
+        if not resp.get('IsTruncated'):
+            return count, size
+        params['StartAfter'] = contents[-1]['Key']
+
+    # Listed pages have every key up to the last key
+    last_key = params['StartAfter']
+    boundaries = [key for key in _boundaries(client, bucket_name) if key > last_key]
+    ranges = key_ranges(boundaries)
+    ranges[0] = (last_key, ranges[0][1])
+    _LOGGER.debug(f'[bucket_usage] list {bucket_name} in {len(ranges)} partitions')
+
+    pool = get_list_pool()
+    futures = [pool.submit(_list_range, client, bucket_name, lower, upper) for lower, upper in ranges]
+    total_count = count
+    total_size = size
+    for future in futures:
+        count, size = future.result()
+        total_count += count
+        total_size += size
+    return total_count, total_size
+
+
+def get_list_pool():
+    """ S3 listing threads of this process
+
+    Number of threads is S3_LIST_WORKERS of global config, shared by
+    all buckets and collections. S3 task runs on scheduler worker and
+    waits for its ranges, so ranges are not run by the scheduler.
+    Range listing never waits for other tasks.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=config.get_global('S3_LIST_WORKERS', DEFAULT_WORKERS),
+                                       thread_name_prefix='s3-list')
+        return _POOL
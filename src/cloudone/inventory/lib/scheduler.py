@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2020 The SpaceONE Authors.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+__all__ = ['FairScheduler', 'get_scheduler']
+
+import logging
+import threading
+
+from collections import deque
+from concurrent.futures import Future
+
+from cloudone.core import config
+
+from cloudone.inventory.lib.metrics import REGISTRY, Gauge
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 32
+# Idle worker exits after this seconds
+IDLE_TIMEOUT = 60
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+class Lane(object):
+    """ Task queue of one collection
+    """
+
+    def __init__(self, scheduler, name):
+        self.scheduler = scheduler
+        self.name = name
+        self.pending = deque()
+        self.queued = False
+
+    def submit(self, fn, *args, **kwargs):
+        """ Submit task to shared workers
+
+        Returns: concurrent.futures.Future
+        """
+        future = Future()
+        self.scheduler._put(self, (future, fn, args, kwargs))
+        return future
+
+
+class FairScheduler(object):
+    """ Process-wide worker threads shared by all collections
+
+    Every collection opens its own lane. Workers take one task from
+    each lane with pending tasks in turn (round-robin), so concurrent
+    collections share workers fairly, and the number of threads (and
+    AWS connections) is bounded by max_workers however many collections
+    are running.
+
+    Tasks must not wait for other tasks of the same scheduler.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.workers = 0
+        self.idle = 0
+        self.active = 0
+        # Tasks which are not taken by a worker yet
+        self.queued = 0
+        self._ready = deque()
+        self._cond = threading.Condition()
+
+    def open_lane(self, name):
+        return Lane(self, name)
+
+    def _put(self, lane, item):
+        with self._cond:
+            lane.pending.append(item)
+            self.queued += 1
+            if not lane.queued:
+                lane.queued = True
+                self._ready.append(lane)
+            # Idle worker takes one task, even if it has not woken up yet
+            if self.queued > self.idle and self.workers < self.max_workers:
+                self.workers += 1
+                t = threading.Thread(target=self._work, name=f'summary-worker-{self.workers}', daemon=True)
+                t.start()
+            self._cond.notify()
+
+    def _next(self):
+        """ Next task in round-robin order of lanes, None if worker has to exit
+        """
+        with self._cond:
+            while not self._ready:
+                self.idle += 1
+                notified = self._cond.wait(IDLE_TIMEOUT)
+                self.idle -= 1
+                if not notified and not self._ready:
+                    self.workers -= 1
+                    return None
+            lane = self._ready.popleft()
+            item = lane.pending.popleft()
+            self.queued -= 1
+            if lane.pending:
+                self._ready.append(lane)
+            else:
+                lane.queued = False
+            self.active += 1
+            return item
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self.active -= 1
+
+
+def get_scheduler():
+    """ Scheduler of this process
+
+    Number of workers is MAX_WORKERS of global config
+    """
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = FairScheduler(config.get_global('MAX_WORKERS', DEFAULT_MAX_WORKERS))
+        return _SCHEDULER
+
+
+def _workers(attr):
+    return lambda: getattr(_SCHEDULER, attr, 0)
+
+
+REGISTRY.register(Gauge('aws_summary_workers', 'Worker threads of scheduler', callback=_workers('workers')))
+REGISTRY.register(Gauge('aws_summary_active_workers', 'Worker threads running a task', callback=_workers('active')))
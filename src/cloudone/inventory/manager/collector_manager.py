@@ -25,6 +25,8 @@ from cloudone.core import config
 from cloudone.core.error import *
 from cloudone.core.manager import BaseManager
 
+from cloudone.inventory.lib.refresher import get_refresher
+
 _LOGGER = logging.getLogger(__name__)
 
 class CollectorManager(BaseManager):
@@ -42,6 +44,10 @@ class CollectorManager(BaseManager):
         return r
 
     def list_resources(self, options, credentials, filters):
+        if options.get('stale_while_revalidate', False):
+            # Latest summary, refreshed in background
+            return get_refresher().get(options, credentials)
+
         # call ec2 connector
 
         connector = self.locator.get_connector('SummaryConnector')
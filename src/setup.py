@@ -41,4 +41,10 @@ setup(
         'cloudone-tester',
         'boto3'
     ],
+
+    entry_points={
+        'console_scripts': [
+            'aws-summary-batch=cloudone.inventory.lib.batch:main',
+        ],
+    },
 )
@@ -47,6 +47,56 @@ class TestCollector(TestCase):
         for res in resource_stream:
             print_json(res)
 
+    def test_collect_count_only(self):
+        options = {'count_only': True}
+        credentials = {
+            'aws_access_key_id': AKI,
+            'aws_secret_access_key': SAK
+        }
+        filter = {}
+        resource_stream = self.inventory.Collector.collect({'options':options, 'credentials':credentials, 'filter':filter})
+
+        for res in resource_stream:
+            print_json(res)
+
+    def test_collect_change_detection(self):
+        options = {'change_detection': True}
+        credentials = {
+            'aws_access_key_id': AKI,
+            'aws_secret_access_key': SAK
+        }
+        filter = {}
+        for i in range(2):
+            resource_stream = self.inventory.Collector.collect({'options':options, 'credentials':credentials, 'filter':filter})
+
+            resource_types = []
+            for res in resource_stream:
+                print_json(res)
+                resource_types.append(res.resource_type)
+
+        # Nothing is changed since the first collection
+        self.assertNotIn('CLOUD_SERVICE', resource_types)
+
+    def test_collect_stale_while_revalidate(self):
+        options = {'stale_while_revalidate': True, 'max_age': 0}
+        credentials = {
+            'aws_access_key_id': AKI,
+            'aws_secret_access_key': SAK
+        }
+        filter = {}
+        collections = []
+        for i in range(2):
+            resource_stream = self.inventory.Collector.collect({'options':options, 'credentials':credentials, 'filter':filter})
+
+            resources = []
+            for res in resource_stream:
+                print_json(res)
+                resources.append(res)
+            collections.append(resources)
+
+        # Second request gets the stale summary at once, refresh runs in background
+        self.assertEqual(collections[0], collections[1])
+
 
 if __name__ == "__main__":
     unittest.main(testRunner=RichTestRunner)
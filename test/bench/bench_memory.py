@@ -0,0 +1,169 @@
+"""
+Peak memory of collection, as number of S3 buckets and regions grows
+
+AWS is replaced by fake clients, which generate responses page by page,
+so only memory of collector itself is measured.
+Every case runs in its own process, since peak RSS never goes down.
+With --s3-latency, S3 is the longest task. Buckets of fake regions are
+spread over the whole bucket list, so the first region is emitted near the end of S3.
+
+example)
+
+python test/bench/bench_memory.py --buckets 1000 10000 100000 --regions 4 16 64
+python test/bench/bench_memory.py --buckets 2000 --regions 16 --s3-latency 0.005
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from cloudone.core.transaction import Transaction
+
+from cloudone.inventory.connector.summary_connector import SummaryConnector
+from cloudone.inventory.lib.profiler import MemoryTracker
+
+BUCKETS_PER_PAGE = 1000
+
+# One page of every regional service
+PAGE = {
+    'Reservations': [{'Instances': [{'InstanceType': 't3.micro',
+                                     'State': {'Name': 'running'},
+                                     'Placement': {'AvailabilityZone': 'bench-a'}}]}],
+    'LoadBalancerDescriptions': [{}],
+    'LoadBalancers': [{'Type': 'application', 'Scheme': 'internet-facing'}],
+    'TableNames': ['table'],
+    'Functions': [{'Runtime': 'python3.8'}],
+    'DBClusters': [{'Engine': 'aurora'}],
+    'DBInstances': [{'Engine': 'mysql'}],
+    'HostedZones': [{}],
+}
+
+
+class FakePaginator(object):
+    def __init__(self, client, operation):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        if self.operation == 'list_buckets':
+            # Like S3, BucketRegion is returned only if request has a parameter
+            return self.client.bucket_pages(with_region=bool(kwargs))
+        return iter([PAGE])
+
+
+class FakeClient(object):
+    def __init__(self, buckets, regions, s3_latency):
+        self.buckets = buckets
+        self.regions = regions
+        self.s3_latency = s3_latency
+
+    def can_paginate(self, operation):
+        return True
+
+    def get_paginator(self, operation):
+        return FakePaginator(self, operation)
+
+    def _bucket_region(self, name):
+        return self.regions[int(name.split('-')[1]) % len(self.regions)]
+
+    def bucket_pages(self, with_region):
+        for start in range(0, self.buckets, BUCKETS_PER_PAGE):
+            end = min(start + BUCKETS_PER_PAGE, self.buckets)
+            buckets = []
+            for idx in range(start, end):
+                bucket = {'Name': f'bucket-{idx}'}
+                if with_region:
+                    bucket['BucketRegion'] = self._bucket_region(bucket['Name'])
+                buckets.append(bucket)
+            yield {'Buckets': buckets}
+
+    def get_bucket_location(self, Bucket):
+        return {'LocationConstraint': self._bucket_region(Bucket)}
+
+    def list_objects_v2(self, **kwargs):
+        time.sleep(self.s3_latency)
+        return {'Contents': [{'Key': 'object', 'Size': 1024}], 'IsTruncated': False}
+
+    def get_caller_identity(self):
+        return {'Account': '000000000000'}
+
+
+class FakeResource(object):
+    def __init__(self, client):
+        self.meta = self
+        self.client = client
+
+
+class FakeSession(object):
+    def __init__(self, buckets, regions, s3_latency):
+        self.buckets = buckets
+        self.regions = regions
+        self.s3_latency = s3_latency
+
+    def client(self, service, **kwargs):
+        return FakeClient(self.buckets, self.regions, self.s3_latency)
+
+    def resource(self, service, **kwargs):
+        return FakeResource(self.client(service))
+
+
+class BenchConnector(SummaryConnector):
+    """ SummaryConnector of fake session
+    """
+
+    def __init__(self, buckets, regions, s3_latency):
+        super().__init__(Transaction(), {})
+        self.fake_session = FakeSession(buckets, [f'bench-{idx}' for idx in range(regions)], s3_latency)
+
+    def _set_connect(self, cred, region='ap-northeast-2', service='ec2'):
+        self.session = self.fake_session
+
+    def _find_all_regions(self, cred):
+        return self.session.regions
+
+
+def run_case(buckets, regions, s3_latency):
+    conn = BenchConnector(buckets, regions, s3_latency)
+    conn.verify({}, {})
+    responses = 0
+    first_region = None
+    start = time.perf_counter()
+    with MemoryTracker() as memory:
+        for response in conn.collect_info(query={}):
+            responses += 1
+            if first_region is None and response['resource_type'] == 'CLOUD_SERVICE':
+                first_region = time.perf_counter() - start
+    result = {'buckets': buckets, 'regions': regions, 'responses': responses,
+              'first_region(s)': first_region, 'total(s)': time.perf_counter() - start}
+    result.update(memory.summary())
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of collection with fake AWS')
+    parser.add_argument('--buckets', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--regions', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('--s3-latency', type=float, default=0, help='seconds of listing one bucket (default: 0)')
+    parser.add_argument('--case', type=int, nargs=2, metavar=('BUCKETS', 'REGIONS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(*args.case, args.s3_latency)
+        return
+
+    print(f"{'buckets':>10} {'regions':>8} {'responses':>10} {'peak_traced(MB)':>16} {'peak_rss(MB)':>13} "
+          f"{'first_region(s)':>16} {'total(s)':>9}")
+    for buckets in args.buckets:
+        for regions in args.regions:
+            out = subprocess.run([sys.executable, __file__, '--case', str(buckets), str(regions),
+                                  '--s3-latency', str(args.s3_latency)],
+                                 check=True, capture_output=True, text=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['buckets']:>10} {r['regions']:>8} {r['responses']:>10} "
+                  f"{r['peak_traced(MB)']:>16.2f} {r['peak_rss(MB)']:>13.2f} "
+                  f"{r['first_region(s)']:>16.2f} {r['total(s)']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
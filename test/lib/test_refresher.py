@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+from cloudone.inventory.lib.refresher import SummaryRefresher
+
+CREDENTIALS = {'aws_access_key_id': 'AKI', 'aws_secret_access_key': 'SAK'}
+
+
+class FakeCollector(object):
+    """ collect_summary, which returns number of collections so far
+    """
+
+    def __init__(self, seconds=0.2):
+        self.seconds = seconds
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, options, credentials):
+        time.sleep(self.seconds)
+        with self.lock:
+            self.calls += 1
+            return [self.calls]
+
+
+class TestSummaryRefresher(unittest.TestCase):
+
+    def setUp(self):
+        self.collector = FakeCollector()
+        patcher = mock.patch('cloudone.inventory.lib.refresher.collect_summary', self.collector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.refresher = SummaryRefresher(interval=3600)
+
+    def test_concurrent_first_requests(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.refresher.get({}, CREDENTIALS)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.collector.calls, 1)
+        self.assertEqual(results, [[1]] * 5)
+
+    def test_hit(self):
+        self.assertEqual(self.refresher.get({'max_age': 60}, CREDENTIALS), [1])
+        self.assertEqual(self.refresher.get({'max_age': 60}, CREDENTIALS), [1])
+        time.sleep(0.5)
+        self.assertEqual(self.collector.calls, 1)
+
+    def test_stale_schedules_refresh(self):
+        self.assertEqual(self.refresher.get({'max_age': 0}, CREDENTIALS), [1])
+        # Stale summary is returned at once, and refreshed in background
+        start = time.perf_counter()
+        self.assertEqual(self.refresher.get({'max_age': 0}, CREDENTIALS), [1])
+        self.assertLess(time.perf_counter() - start, self.collector.seconds)
+
+        deadline = time.time() + 5
+        while self.collector.calls < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.collector.calls, 2)
+        self.assertEqual(self.refresher.get({'max_age': 60}, CREDENTIALS), [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
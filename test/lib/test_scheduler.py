@@ -0,0 +1,44 @@
+import threading
+import time
+import unittest
+
+from cloudone.inventory.lib.scheduler import FairScheduler
+
+
+class TestFairScheduler(unittest.TestCase):
+
+    def test_burst_with_idle_worker(self):
+        scheduler = FairScheduler(max_workers=64)
+        lane = scheduler.open_lane('warm-up')
+        lane.submit(lambda: None).result()
+        # Warmed-up worker is idle now
+        time.sleep(0.1)
+
+        lane = scheduler.open_lane('burst')
+        start = time.perf_counter()
+        futures = [lane.submit(time.sleep, 0.2) for _ in range(64)]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 2)
+        self.assertGreater(scheduler.workers, 1)
+
+    def test_round_robin_lanes(self):
+        scheduler = FairScheduler(max_workers=1)
+        gate = threading.Event()
+        order = []
+        blocker = scheduler.open_lane('blocker').submit(gate.wait)
+
+        lane_a = scheduler.open_lane('a')
+        lane_b = scheduler.open_lane('b')
+        futures = [lane_a.submit(order.append, 'a') for _ in range(3)]
+        futures += [lane_b.submit(order.append, 'b') for _ in range(3)]
+        gate.set()
+        blocker.result()
+        for future in futures:
+            future.result()
+        self.assertEqual(order, ['a', 'b', 'a', 'b', 'a', 'b'])
+
+
+if __name__ == "__main__":
+    unittest.main()